@@ -1,29 +1,84 @@
 #!/usr/bin/env python3
 import argparse
+import atexit
+import collections
+import functools
+import glob
+import hashlib
+import http.client
 import json
+import mmap
 import pathlib
+import re
+import select
 import shutil
 import signal
 import struct
 import subprocess
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
 import traceback
-from io import BytesIO
 import time
-from multiprocessing import Manager, Process, Queue, Value
-import queue as queue_mod
+from multiprocessing import Pipe, Process, Semaphore, Value, shared_memory
+from multiprocessing.connection import Connection
 import sys
 import ctypes
 import datetime
-import threading
+from fractions import Fraction
 from types import TracebackType
-from PIL import Image
+import numpy as np
 import os
+try:
+    import fcntl
+except ModuleNotFoundError:
+    fcntl = None
 
 __author__ = "Revnoplex"
 __copyright__ = f"Copyright (C) {__author__} 2022-2024"
 __license__ = "MIT"
 __version__ = "1.2.0"
 PROGRAM_NAME = "vidtty"
+ASCII_GRADIENTS = " .'`^\",:;Il!i><~+_-?][}{1)(|\\/tfjrxnuvczXYUJCLQ0OZmwqpdbkhao*#MW&8%B@$"
+# maps every possible brightness value (0-255) straight to the byte of its ascii character, as a bytes.translate table
+ASCII_LUT = bytes(
+    ord(ASCII_GRADIENTS[int(level // (255 / (len(ASCII_GRADIENTS) - 1)))]) for level in range(256)
+)
+# how many of the most recent frames the rendering rate and ETA are averaged over
+AVERAGE_INTERVAL_WINDOW = 64
+# how much shared memory can be used to buffer rendered frames ahead of playback
+FRAME_BUFFER_SIZE = 64 * 1024 ** 2
+# frames are small, so writes to vidtxt files are buffered into large chunks
+DUMP_WRITE_BUFFER_SIZE = 1024 ** 2
+# how often progress text is redrawn in seconds, it doesn't need to be redrawn for every frame
+PROGRESS_UPDATE_INTERVAL = 0.1
+# a single frame can be bigger than the default 64 KiB pipe size, which stalls ffmpeg between reads
+PIPE_BUFFER_SIZE = 1024 ** 2
+# everything kept between runs goes in here
+CACHE_DIR = pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache") / PROGRAM_NAME
+# where the metadata of previously played videos is kept
+METADATA_CACHE_DIR = CACHE_DIR / "metadata"
+# where videos played from a url are downloaded to, the default temporary directory is often too small a ram disk
+DOWNLOAD_DIR = CACHE_DIR / "downloads"
+# how long to wait in seconds for a server to answer or send more data before retrying
+DOWNLOAD_TIMEOUT = 30
+# how many times a dropped download is resumed before giving up
+DOWNLOAD_RETRIES = 5
+# playlists point to segments relative to their own url, so they are left for ffmpeg to read instead of downloaded
+PLAYLIST_CONTENT_TYPES = {
+    "application/vnd.apple.mpegurl", "application/x-mpegurl", "audio/mpegurl", "audio/x-mpegurl",
+    "application/dash+xml"
+}
+# playlists are often served with a generic content type, so their extension is checked as well
+PLAYLIST_EXTENSIONS = (".m3u8", ".m3u", ".mpd")
+# format of the --video-size argument: {columns}x{lines}
+VIDEO_SIZE_PATTERN = re.compile(r"(\d+)x(\d+)")
+# a tiny silent wav file played before the actual audio to warm up the audio player
+BLANK_WAV = (
+    b'RIFF%\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00\x01\x00D\xac\x00\x00\x88X'
+    b'\x01\x00\x02\x00\x10\x00datat\x00\x00\x00\x00'
+)
 
 
 class OpenError(BaseException):
@@ -49,39 +104,106 @@ def exception_handler(
 sys.excepthook = exception_handler
 
 
-def check_for_errors(command: subprocess.Popen, allow_read=False):
-    if command.returncode:
-        return command.stderr.read()
-    if allow_read:
-        try:
-            command.wait(timeout=.1)
-        except subprocess.TimeoutExpired:
-            return
-        if command.returncode:
-            return command.stderr.read()
-        else:
-            return
+def check_for_errors(command: subprocess.Popen, error_log=None):
+    # only treat the output as an error if the command exits within the time limit
+    try:
+        command.wait(timeout=.1)
+    except subprocess.TimeoutExpired:
+        return
+    if error_log is None:
+        # stderr is a pipe the caller reads progress from, so only a failed exit counts as an error
+        return command.stderr.read() if command.returncode else None
+    error_log.seek(0)
+    return error_log.read()
+
 
-    def enqueue_output(out, pq):
-        pq.put(out.read())
+def failed_command_output(command: subprocess.Popen, error_log) -> bytes | None:
+    # only call this once the command has stopped writing, waits for it to exit and returns what it printed if it failed
+    if not command.wait():
+        return None
+    error_log.seek(0)
+    return error_log.read()
 
-    q = queue_mod.Queue()
-    t = threading.Thread(target=enqueue_output, args=(command.stderr, q))
-    t.daemon = True  # thread dies with the program
-    t.start()
 
+def enlarge_pipe(pipe) -> None:
+    # F_SETPIPE_SZ only exists on linux
+    if fcntl is None or sys.platform != "linux":
+        return
     try:
-        line = q.get(timeout=.1)
-    except queue_mod.Empty:
+        fcntl.fcntl(pipe.fileno(), getattr(fcntl, "F_SETPIPE_SZ", 1031), PIPE_BUFFER_SIZE)
+    except OSError:
+        # the size is capped by /proc/sys/fs/pipe-max-size for unprivileged users, the default is fine then
+        pass
+
+
+def pin_to_cpu(index: int) -> None:
+    # keeps the renderer and the printer on separate cores. only called once each process has spawned its ffmpeg and
+    # audio player children, so those can still be scheduled on any core
+    if not hasattr(os, "sched_setaffinity"):
         return
-    else:
-        return line
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < 2:
+        return
+    try:
+        os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+    except OSError:
+        pass
+
+
+@functools.cache
+def audio_player_command() -> list[str] | None:
+    # PATH is only searched once, every audio player started after that reuses the result
+    if shutil.which("aplay"):
+        return ["aplay", "--quiet"]
+    if shutil.which("play"):
+        return ["play", "-q", "-V1", "-t", "wav", "-"]
+    return None
+
+
+def read_frame(pipe, frame: memoryview) -> bool:
+    # reads from an unbuffered pipe can come back short, so keep reading until the frame is full or the pipe ends
+    filled = 0
+    while filled < len(frame):
+        read_size = pipe.readinto(frame[filled:])
+        if not read_size:
+            return False
+        filled += read_size
+    return True
+
+
+def ffmpeg_input_options(video_filename: str) -> list[str]:
+    # lets ffmpeg pick a dropped connection back up when it reads a url itself instead of a downloaded copy
+    if video_filename.startswith(("http://", "https://")):
+        return ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5", "-i", video_filename]
+    return ["-i", video_filename]
+
+
+def frame_to_ascii(frame: bytes | bytearray, frame_size: list[int], out: np.ndarray | None = None) -> np.ndarray:
+    terminal_columns, terminal_lines = frame_size
+    # translate does the whole lookup in one pass over the frame. it allocates a new frame sized bytes object every
+    # time, but is still more than twice as fast as an allocation free np.take straight into the output
+    characters = np.frombuffer(frame.translate(ASCII_LUT), dtype=np.uint8).reshape(terminal_lines, terminal_columns)
+    # the last line and first column of each frame are not drawn, so they are cropped out
+    if out is None:
+        return characters[:-1, 1:].copy()
+    out[...] = characters[:-1, 1:]
+    return out
+
+
+def print_progress_bar(text: str, progress: float):
+    percentage = f"[ {round(progress * 100)}% ]"
+    bar = (text + " " * (terminal_size.columns - (len(text) + len(percentage))) + percentage).encode("utf-8")
+    filled = round(progress * terminal_size.columns)
+    # the whole bar goes out in a single write, anything print() still has buffered needs to go first
+    sys.stdout.flush()
+    sys.stdout.buffer.write(b"\r\x1b[7m" + bar[:filled] + b"\x1b[0m" + bar[filled:])
+    sys.stdout.buffer.flush()
 
 
 def dump_frames(video_filename: str, fps: float, frame_size: list[int]):
     terminal_columns, terminal_lines = frame_size
     if url:
-        formatted_name = video_filename.split("/")[-1].split("?")[0].strip("/")
+        formatted_name = args.filename.split("/")[-1].split("?")[0].strip("/")
         to_write_name = f'{formatted_name.split(".", 1)[0]}.vidtxt'
     elif stdin:
         to_write_name = "stdin.vidtxt"
@@ -92,15 +214,16 @@ def dump_frames(video_filename: str, fps: float, frame_size: list[int]):
         overwrite_file = input("Overwrite? [y/n]: ")
         if not overwrite_file.lower().startswith("y"):
             file_path = pathlib.Path(to_write_name)
-            highest_number = 0
-            for file in file_path.parent.iterdir():
-                if file.name.startswith(f'{file_path.stem}.') and file.name.endswith(f'{file_path.suffix}'):
-                    raw_number = file.stem.split(".")[-1]
-                    if raw_number.isdecimal() and int(raw_number) > highest_number:
-                        highest_number = int(raw_number)
-            to_write_name = f'{file_path.stem}.{highest_number + 1}{file_path.suffix}'
+            numbered_name = re.compile(rf"{re.escape(file_path.stem)}\.(\d+){re.escape(file_path.suffix)}")
+            highest_number = max(
+                (int(match.group(1)) for file in file_path.parent.glob(
+                    f"{glob.escape(file_path.stem)}.*{glob.escape(file_path.suffix)}"
+                ) if (match := numbered_name.fullmatch(file.name))),
+                default=0
+            )
+            to_write_name = str(file_path.with_name(f'{file_path.stem}.{highest_number + 1}{file_path.suffix}'))
     print(f"Writing to \x1b[1m{to_write_name}\x1b[0m")
-    file_to_write = open(to_write_name, "wb")
+    file_to_write = open(to_write_name, "wb", buffering=DUMP_WRITE_BUFFER_SIZE)
     #                      0 to 5    6   7     8 to 11       12 to 15    16 to 23    24 to 31
     # layout of header: VIDTXT(str) NUL NUL {columns}(u32) {lines}(u32) {fps}(f64) {audio_size}(u64)
     # NUL to byte 0x3F
@@ -117,188 +240,153 @@ def dump_frames(video_filename: str, fps: float, frame_size: list[int]):
     #                           24 to 63
     # mem_file = initial_header + b'\x00' * (64 - len(initial_header))
     file_to_write.write(initial_header + b'\x00' * (64 - len(initial_header)))
-    raw_video = subprocess.Popen(["ffmpeg", "-nostdin", "-i", video_filename, "-loglevel", "error", "-s",
-                                  f"{terminal_columns}x{terminal_lines}", "-c:v", "bmp", "-f", "rawvideo", "-an",
-                                  "pipe:1"],
-                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    raw_video_errors = check_for_errors(raw_video)
+    # ffmpeg can keep writing errors for as long as it runs, which would fill up and block on a pipe nobody reads
+    raw_video_error_log = tempfile.TemporaryFile()
+    raw_video = subprocess.Popen(["ffmpeg", "-nostdin", *ffmpeg_input_options(video_filename), "-loglevel",
+                                  "error", "-s", f"{terminal_columns}x{terminal_lines}", "-pix_fmt", "gray", "-f",
+                                  "rawvideo", "-an", "pipe:1"],
+                                 stdout=subprocess.PIPE, stderr=raw_video_error_log, bufsize=0)
+    enlarge_pipe(raw_video.stdout)
+    raw_video_errors = check_for_errors(raw_video, raw_video_error_log)
     if raw_video_errors:
         print("\x1b[1;31mFatal\x1b[0m: Failed to read video:")
         print(raw_video_errors.decode("utf-8"))
         return
     file_to_write.seek(64, 0)
     if not no_audio_required:
-        ffmpeg_options = ["ffmpeg", "-nostdin"] + (["-reconnect", "1", "-reconnect_streamed", "1",
-                                                    "-reconnect_delay_max", "5"] if url else []) + \
-                         ["-progress", "pipe:2", "-i", video_filename, "-loglevel", "error", "-f", "mp3", "pipe:1"]
+        ffmpeg_options = ["ffmpeg", "-nostdin", "-progress", "pipe:2", *ffmpeg_input_options(video_filename),
+                          "-loglevel", "error", "-f", "mp3", "pipe:1"]
         audio = subprocess.Popen(ffmpeg_options, stdout=file_to_write, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        audio_errors = check_for_errors(audio, allow_read=True)
+        audio_errors = check_for_errors(audio)
         if audio_errors:
             print("\x1b[1;33mWarning\x1b[0m: Extracting audio failed:")
             print(audio_errors.decode("utf-8"))
             print("Continuing without audio...")
         else:
             while audio.poll() is None:
+                # wait for ffmpeg to report progress instead of spinning on an empty or closed pipe
+                if not select.select([audio.stderr], [], [], 0.25)[0]:
+                    continue
+                progress_output = os.read(audio.stderr.fileno(), 4096)
+                if not progress_output:
+                    audio.wait()
+                    break
                 duration_processed = 0
-                for line in os.read(audio.stderr.fileno(), 200).split(b'\n'):
+                for line in progress_output.split(b'\n'):
                     split_line = line.decode("utf-8").split("=")
                     if split_line[0] == "out_time_ms" and len(split_line) > 1 and split_line[1].isdecimal():
                         duration_processed = int(split_line[1]) // 10**6
                 if duration_processed != 0:
-                    progress_text = f"\x1b[7m\rExtracting audio from video file: " \
-                                    f"{str(datetime.timedelta(seconds=duration_processed)).split('.')[0]}/" \
-                                    f"{str(datetime.timedelta(seconds=video_duration)).split('.')[0]}"
-                    percentage = f"[ {round(duration_processed / video_duration * 100)}% ]"
-                    progress_text = \
-                        progress_text + " " * (shutil.get_terminal_size().columns - (
-                                    (len(progress_text) - 5) + len(percentage))) + percentage
-                    progress_pos = round(duration_processed / video_duration * shutil.get_terminal_size().columns) + 5
-                    if progress_pos > 1:
-                        progress_text = progress_text[:progress_pos + 1] + "\x1b[0m" + progress_text[progress_pos + 1:]
-                    else:
-                        progress_text = progress_text[:2] + "\x1b[0m" + progress_text[:2]
-                    print(progress_text, end="")
+                    print_progress_bar(
+                        f"Extracting audio from video file: "
+                        f"{str(datetime.timedelta(seconds=duration_processed)).split('.')[0]}/"
+                        f"{str(datetime.timedelta(seconds=video_duration)).split('.')[0]}",
+                        duration_processed / video_duration
+                    )
             # audio_bytes = audio_bytes_container.read()
             audio_byte_count = os.fstat(file_to_write.fileno()).st_size - 64
             # 24 to 31
             # mem_file = mem_file[:24] + len(audio_bytes).to_bytes(8, "big", signed=False) + mem_file[32:]
-            file_to_write.seek(24)
-            file_to_write.write(audio_byte_count.to_bytes(8, "big", signed=False))
+            os.pwrite(file_to_write.fileno(), audio_byte_count.to_bytes(8, "big", signed=False), 24)
+            # ffmpeg wrote the audio straight to the file descriptor, so the buffered position needs to catch up
             file_to_write.seek(64+audio_byte_count, 0)
             #                      64 to audio_size+63
             # mem_file = mem_file + audio_bytes
 
     # file_to_write.write(mem_file)
-    avg_interval_list = []
+    avg_interval_window = collections.deque(maxlen=AVERAGE_INTERVAL_WINDOW)
+    avg_interval_sum = 0.0
 
+    raw_frame = bytearray(terminal_columns * terminal_lines)
+    raw_frame_view = memoryview(raw_frame)
+    ascii_frame = np.empty((terminal_lines - 1, terminal_columns - 1), dtype=np.uint8)
+    last_progress_update = 0.0
     current_frame = 0
     while True:
-        start_time = datetime.datetime.now()
-        # if not video.isOpened():
-        #     print("\x1b[1;31mFatal\x1b[0m: Failed to open video", file=sys.stderr)
-        #     return
-        # need new fail checker
+        start_time = time.perf_counter()
         average_interval = 1.0
-        if len(avg_interval_list) > 0:
-            average_interval = sum(avg_interval_list) / len(avg_interval_list)
-        average_fps = round(1 / average_interval, 1)
-        time_left = average_interval * (total_frames - current_frame)
-        progress_text = f"\x1b[7m\rWriting Frame: {current_frame}/{total_frames} " \
-                        f" Rate: {average_fps}/s ETA:" \
-                        f" {str(datetime.timedelta(seconds=time_left)).split('.')[0]}"
-        percentage = f"[ {round(current_frame / total_frames*100)}% ]"
-        progress_text = (progress_text +
-                         " "*(shutil.get_terminal_size().columns-((len(progress_text)-5)+len(percentage))) + percentage)
-        # print("\r" + repr(progress_text), end="")
-        progress_pos = round(current_frame / total_frames*shutil.get_terminal_size().columns) + 5
-        # print(progress_pos)
-        if progress_pos > 1:
-            progress_text = progress_text[:progress_pos+1] + "\x1b[0m" + progress_text[progress_pos+1:]
-        else:
-            progress_text = progress_text[:2] + "\x1b[0m" + progress_text[:2]
-        # print("\r" + progress_text[progress_pos+1:], end="")
-        print(progress_text, end="")
-        raw_video.stdout.read(2)
-        current_size = int.from_bytes(raw_video.stdout.read(4), "little", signed=False)
-        if current_size >= 6:
-            raw_video_bin = b'BM' + current_size.to_bytes(4, "little", signed=False) + \
-                            raw_video.stdout.read(current_size - 6)
-        else:
-            break
-        if current_size < 1:
+        if len(avg_interval_window) > 0:
+            average_interval = avg_interval_sum / len(avg_interval_window)
+        if start_time - last_progress_update >= PROGRESS_UPDATE_INTERVAL or current_frame == total_frames - 1:
+            last_progress_update = start_time
+            average_fps = round(1 / average_interval, 1)
+            time_left = average_interval * (total_frames - current_frame)
+            print_progress_bar(
+                f"Writing Frame: {current_frame}/{total_frames}  Rate: {average_fps}/s ETA:"
+                f" {str(datetime.timedelta(seconds=time_left)).split('.')[0]}",
+                current_frame / total_frames
+            )
+        if not read_frame(raw_video.stdout, raw_frame_view):
+            raw_video_errors = failed_command_output(raw_video, raw_video_error_log)
+            if raw_video_errors is not None:
+                print("\n\x1b[1;31mFatal\x1b[0m: Failed to read video:")
+                print(raw_video_errors.decode("utf-8"))
             break
-        frame = Image.open(BytesIO(raw_video_bin))
-        img_data = frame.getdata()
-        ascii_gradients = [' ', '.', "'", '`', '^', '"', ',', ':', ';', 'I', 'l', '!', 'i', '>', '<', '~', '+',
-                           '_', '-', '?', ']', '[', '}', '{', '1', ')', '(', '|', '\\', '/', 't', 'f', 'j', 'r',
-                           'x', 'n', 'u', 'v', 'c', 'z', 'X', 'Y', 'U', 'J', 'C', 'L', 'Q', '0', 'O', 'Z', 'm',
-                           'w', 'q', 'p', 'd', 'b', 'k', 'h', 'a', 'o', '*', '#', 'M', 'W', '&', '8', '%', 'B',
-                           '@', '$']
-        frame_width = frame.width
-        # frame_list: list[list[int, list[list[str, int]]]] = []
-        frame_list = ""
-        line = ""
-        for index, pixel in enumerate(img_data):
-            if index % frame_width:
-                average_pixel_gradient = sum(pixel) / 3
-                line += ascii_gradients[int(int(average_pixel_gradient) // (255 / (len(ascii_gradients) - 1)))]
-            else:
-                frame_list += line
-                line = ""
-
-        file_to_write.write(frame_list.encode("utf-8"))
+        file_to_write.write(frame_to_ascii(raw_frame, frame_size, out=ascii_frame))
         current_frame += 1
-        duration = (datetime.datetime.now() - start_time).total_seconds()
-        avg_interval_list.append(duration)
+        duration = time.perf_counter() - start_time
+        if len(avg_interval_window) == avg_interval_window.maxlen:
+            avg_interval_sum -= avg_interval_window[0]
+        avg_interval_window.append(duration)
+        avg_interval_sum += duration
         if current_frame == total_frames:
             break
     file_to_write.close()
 
 
-def render_frames(frames: Queue, dumped_frames: Value, dumping_interval: Value,
-                  error: Queue, video_filename: str, total_frame_count: int, frame_size: list[int]):
+def render_frames(frame_buffer: shared_memory.SharedMemory, buffer_slots: int, buffered_frames: Semaphore,
+                  free_frame_slots: Semaphore, dumped_frames: Value, dumping_interval: Value,
+                  error: Connection, video_filename: str, total_frame_count: int, frame_size: list[int]):
     try:
         current_frame = 0
-        avg_interval_list = []
+        avg_interval_window = collections.deque(maxlen=AVERAGE_INTERVAL_WINDOW)
+        avg_interval_sum = 0.0
         terminal_columns, terminal_lines = frame_size
-        raw_video = subprocess.Popen(["ffmpeg", "-nostdin", "-i", video_filename, "-loglevel", "error", "-s",
-                                      f"{terminal_columns}x{terminal_lines}", "-c:v", "bmp", "-f", "rawvideo", "-an",
-                                      "pipe:1"],
-                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        raw_video_errors = check_for_errors(raw_video)
+        frame_slots = np.ndarray(
+            (buffer_slots, terminal_lines - 1, terminal_columns - 1), dtype=np.uint8, buffer=frame_buffer.buf
+        )
+        raw_frame = bytearray(terminal_columns * terminal_lines)
+        raw_frame_view = memoryview(raw_frame)
+        # ffmpeg can keep writing errors for as long as it runs, which would fill up and block on a pipe nobody reads
+        raw_video_error_log = tempfile.TemporaryFile()
+        raw_video = subprocess.Popen(["ffmpeg", "-nostdin", *ffmpeg_input_options(video_filename), "-loglevel",
+                                      "error", "-s", f"{terminal_columns}x{terminal_lines}", "-pix_fmt", "gray", "-f",
+                                      "rawvideo", "-an", "pipe:1"],
+                                     stdout=subprocess.PIPE, stderr=raw_video_error_log, bufsize=0)
+        enlarge_pipe(raw_video.stdout)
+        raw_video_errors = check_for_errors(raw_video, raw_video_error_log)
         if raw_video_errors:
             print("\x1b[1;31mFatal\x1b[0m: Failed to read video:")
             print(raw_video_errors.decode("utf-8"))
             return
+        pin_to_cpu(0)
         while True:
-            start_time = datetime.datetime.now()
+            start_time = time.perf_counter()
             average_interval = 1.0
-            if len(avg_interval_list) > 0:
-                average_interval = sum(avg_interval_list)/len(avg_interval_list)
+            if len(avg_interval_window) > 0:
+                average_interval = avg_interval_sum / len(avg_interval_window)
             dumping_interval.value = average_interval
             dumped_frames.value = current_frame
-            raw_video.stdout.read(2)
-            current_size = int.from_bytes(raw_video.stdout.read(4), "little", signed=False)
-            if current_size >= 6:
-                raw_video_bin = b'BM' + current_size.to_bytes(4, "little", signed=False) + \
-                                raw_video.stdout.read(current_size - 6)
-            else:
-                break
-            if current_size < 1:
+            if not read_frame(raw_video.stdout, raw_frame_view):
+                raw_video_errors = failed_command_output(raw_video, raw_video_error_log)
+                if raw_video_errors is not None:
+                    raise RuntimeError(f"ffmpeg failed while reading the video:\n{raw_video_errors.decode('utf-8')}")
                 break
-            frame = Image.open(BytesIO(raw_video_bin))
-
-            img_data = frame.getdata()
-            ascii_gradients = [' ', '.', "'", '`', '^', '"', ',', ':', ';', 'I', 'l', '!', 'i', '>', '<', '~', '+',
-                               '_', '-', '?', ']', '[', '}', '{', '1', ')', '(', '|', '\\', '/', 't', 'f', 'j', 'r',
-                               'x', 'n', 'u', 'v', 'c', 'z', 'X', 'Y', 'U', 'J', 'C', 'L', 'Q', '0', 'O', 'Z', 'm',
-                               'w', 'q', 'p', 'd', 'b', 'k', 'h', 'a', 'o', '*', '#', 'M', 'W', '&', '8', '%', 'B',
-                               '@', '$']
-            frame_width = frame.width
-            h_line_idx = 0
-            frame_list: list[list[int | str, ]] = []
-            frame_num = 0
-            line = ""
-            for index, pixel in enumerate(img_data):
-                if index % frame_width:
-                    average_pixel_gradient = sum(pixel) / 3
-                    line += ascii_gradients[int(int(average_pixel_gradient) // (255 / (len(ascii_gradients) - 1)))]
-                else:
-                    if h_line_idx < terminal_lines - 1:
-                        frame_list.append([h_line_idx, line])
-                        frame_num += 1
-                    h_line_idx += 1
-                    line = ""
-
-            frames.put((current_frame, frame_list))
+            # frames are converted straight into the shared memory ring buffer in order, one slot per frame
+            free_frame_slots.acquire()
+            frame_to_ascii(raw_frame, frame_size, out=frame_slots[current_frame % buffer_slots])
+            buffered_frames.release()
             current_frame += 1
-            duration = (datetime.datetime.now() - start_time).total_seconds()
-            avg_interval_list.append(duration)
+            duration = time.perf_counter() - start_time
+            if len(avg_interval_window) == avg_interval_window.maxlen:
+                avg_interval_sum -= avg_interval_window[0]
+            avg_interval_window.append(duration)
+            avg_interval_sum += duration
             if current_frame == total_frame_count:
                 break
         exit()
     except Exception as e:
-        error.put((type(e), e, traceback.extract_tb(e.__traceback__)))
+        error.send((type(e), e, traceback.extract_tb(e.__traceback__)))
 
 
 def vidtxt_info(filename):
@@ -311,7 +399,7 @@ def vidtxt_info(filename):
     frames_start_from = 64 + audio_size
     f_total_frames = \
         (os.stat(filename).st_size - frames_start_from) // ((terminal_columns - 1) * (terminal_lines - 1))
-    vid_duration = (f_total_frames // fps) + (f_total_frames % fps) / fps
+    vid_duration = f_total_frames / fps
     try:
         duration_str = str(datetime.timedelta(seconds=vid_duration))
         fps_str = f"{fps} fps"
@@ -334,7 +422,17 @@ def vidtxt_info(filename):
     )
 
 
-lag = 0
+terminal_size = shutil.get_terminal_size()
+
+
+def update_terminal_size(*_):
+    global terminal_size
+    terminal_size = shutil.get_terminal_size()
+    # curses does not resize itself when another SIGWINCH handler is installed
+    try:
+        curses.resizeterm(terminal_size.lines, terminal_size.columns)
+    except _curses.error:
+        pass
 
 
 def file_print_frames(filename):
@@ -352,71 +450,69 @@ def file_print_frames(filename):
             no_audio_required = True
         f_total_frames = \
             (os.stat(filename).st_size - frames_start_from) // ((terminal_columns - 1) * (terminal_lines - 1))
-        vid_duration = (f_total_frames // fps) + (f_total_frames % fps) / fps
+        vid_duration = f_total_frames / fps
         if not no_audio_required:
-            blank_sound = subprocess.Popen(
-                ["aplay", "--quiet"] if shutil.which("aplay") else ["play", "-q", "-V1", "-t",
-                                                                    "wav", "-"],
-                stdin=subprocess.PIPE)
+            blank_sound = subprocess.Popen(audio_player_command(), stdin=subprocess.PIPE, bufsize=0)
             running_child_processes.append(blank_sound)
-            blank_sound.communicate(input=b'RIFF%\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00\x01\x00D\xac\x00\x00\x88X'
-                                          b'\x01\x00\x02\x00\x10\x00datat\x00\x00\x00\x00')
+            blank_sound.communicate(input=BLANK_WAV)
+            audio_error_log = tempfile.TemporaryFile()
             audio = subprocess.Popen(["ffmpeg", "-nostdin", "-i", "-", "-loglevel", "error", "-f", "wav", "pipe:1"],
-                                     stdin=vidtxt_file, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                                     stdin=vidtxt_file, stdout=subprocess.PIPE, stderr=audio_error_log)
+            enlarge_pipe(audio.stdout)
             running_child_processes.append(audio)
-            audio_errors = check_for_errors(audio)
+            audio_errors = check_for_errors(audio, audio_error_log)
             if audio_errors:
                 print("\x1b[1;31mFatal\x1b[0m: Failed to read audio:")
                 print(audio_errors.decode("utf-8"))
-            audio_cmd = subprocess.Popen(["aplay", "--quiet"] if shutil.which("aplay") else ["play", "-q", "-V1", "-t",
-                                                                                             "wav", "-"],
-                                         stdin=audio.stdout, stderr=subprocess.PIPE)
+            audio_cmd_error_log = tempfile.TemporaryFile()
+            audio_cmd = subprocess.Popen(audio_player_command(), stdin=audio.stdout, stderr=audio_cmd_error_log)
+            # the audio is piped straight from ffmpeg to the player, so the parent has no use for its end of the pipe
+            audio.stdout.close()
             running_child_processes.append(audio_cmd)
-            audio_cmd_errors = check_for_errors(audio_cmd)
+            audio_cmd_errors = check_for_errors(audio_cmd, audio_cmd_error_log)
             if audio_cmd_errors:
                 print("\x1b[1;31mFatal\x1b[0m: Failed to play audio:")
                 print(audio_cmd_errors.decode("utf-8"))
-    with open(filename, "rb") as vidtxt_file:
-        vidtxt_file.seek(frames_start_from, 0)
+    # frames are decoded straight out of the page cache instead of being read into a buffer first
+    with open(filename, "rb") as vidtxt_file, \
+            mmap.mmap(vidtxt_file.fileno(), 0, access=mmap.ACCESS_READ) as vidtxt_map, \
+            memoryview(vidtxt_map) as vidtxt_view:
+        frame_start = frames_start_from
+        frame_columns = terminal_columns - 1
+        frame_bytes = frame_columns * (terminal_lines - 1)
         interval = 1 / fps
         std_scr = curses.initscr()
         curses.noecho()
         curses.cbreak()
-        current_interval = interval
-        global lag
-        current_terminal_lines = shutil.get_terminal_size().lines
-        current_terminal_columns = shutil.get_terminal_size().columns
         eof = False
         frame_number = 0
-        displayed_since = datetime.datetime.now()
+        displayed_since = time.perf_counter()
         try:
             while not eof:
-                time_elapsed = datetime.datetime.now() - displayed_since
-                calculated_frames = round(fps * time_elapsed.total_seconds())
+                current_terminal_lines = terminal_size.lines
+                current_terminal_columns = terminal_size.columns
+                time_elapsed = time.perf_counter() - displayed_since
+                # frames whose display time has already passed are dropped so a slow terminal catches back up with the
+                # audio, the last frame is always drawn
+                if (frame_number + 1) * interval <= time_elapsed and \
+                        frame_start + 2 * frame_bytes <= len(vidtxt_view):
+                    frame_start += frame_bytes
+                    frame_number += 1
+                    continue
+                calculated_frames = round(fps * time_elapsed)
                 frames_behind = calculated_frames - frame_number
-                start_time = datetime.datetime.now()
-                pre_duration = (datetime.datetime.now() - start_time).total_seconds()
-                if pre_duration >= current_interval:
-                    lag += 1
-                    current_interval = (pre_duration - current_interval) / lag
-                std_scr.refresh()
                 try:
-                    iteration = 0
-                    for line in range(terminal_lines - 1):
-                        iteration += 1
-                        line_contents = vidtxt_file.read(terminal_columns - 1)
-                        if not len(line_contents):
-                            eof = True
-                        if line < current_terminal_lines - 1:
-                            if terminal_columns > current_terminal_columns:
-                                std_scr.addstr(line, 0, line_contents.decode("utf-8")[
-                                                        :-(terminal_columns - current_terminal_columns)])
-                            else:
-                                std_scr.addstr(line, 0, line_contents.decode("utf-8"))
+                    frame_text = str(vidtxt_view[frame_start:frame_start + frame_bytes], "ascii")
+                    frame_start += frame_bytes
+                    if len(frame_text) < frame_bytes:
+                        eof = True
+                    for line in range(min(terminal_lines - 1, current_terminal_lines - 1)):
+                        std_scr.addnstr(line, 0, frame_text[line * frame_columns:(line + 1) * frame_columns],
+                                        current_terminal_columns - 1)
                     if args.debug_mode:
                         debug_text = (
                             f"[Frame (required,drawn,lag): ({calculated_frames},{frame_number},{frames_behind}), "
-                            f"{str(time_elapsed).split('.')[0]}]"
+                            f"{str(datetime.timedelta(seconds=time_elapsed)).split('.')[0]}]"
                         )
                         try:
                             end_text = f"[{str(datetime.timedelta(seconds=vid_duration)).split('.')[0]}, " \
@@ -439,26 +535,24 @@ def file_print_frames(filename):
                             debug_text = debug_text + " " * (
                                           current_terminal_columns - (len(debug_text) + len(end_text))) + end_text
                         progress = round(calculated_frames / f_total_frames * current_terminal_columns)
-                        for idx, char in enumerate(debug_text):
-                            if idx < current_terminal_columns - 1:
-                                f_format = curses.A_STANDOUT if idx < progress else curses.A_NORMAL
-                                try:
-                                    std_scr.addch(current_terminal_lines - 1, idx, char, f_format)
-                                except _curses.error:
-                                    pass
+                        try:
+                            std_scr.addnstr(current_terminal_lines - 1, 0, debug_text, current_terminal_columns - 1)
+                            std_scr.chgat(current_terminal_lines - 1, 0, min(progress, current_terminal_columns - 1),
+                                          curses.A_STANDOUT)
+                        except _curses.error:
+                            pass
+                    std_scr.refresh()
                 except _curses.error:
-                    continue
+                    # the frame has still been used up, so it is counted like any other to keep the frame number in
+                    # step with the position in the file
+                    pass
                 frame_number += 1
-                duration = (datetime.datetime.now() - start_time).total_seconds()
                 try:
-                    if duration < current_interval:
-                        if frames_behind < 1:
-                            time.sleep(current_interval - duration)
-                        if frames_behind < 0:
-                            time.sleep(current_interval - duration)
-                    else:
-                        lag += 1
-                        current_interval = (duration - current_interval) / lag
+                    # frames are paced against fixed deadlines from the start of playback, so an overrun on one frame
+                    # is caught up on the next ones instead of delaying every frame after it
+                    time_until_next_frame = displayed_since + frame_number * interval - time.perf_counter()
+                    if time_until_next_frame > 0:
+                        time.sleep(time_until_next_frame)
                 except OverflowError:
                     curses.echo()
                     curses.nocbreak()
@@ -470,8 +564,6 @@ def file_print_frames(filename):
                         f"Example: {PROGRAM_NAME} -ds {terminal_columns}x{terminal_lines} ORIGINAL_FILENAME"
                     )
                     return
-                if current_interval < interval:
-                    current_interval = interval
         finally:
             for child in running_child_processes:
                 child.terminate()
@@ -481,18 +573,20 @@ def file_print_frames(filename):
                 curses.endwin()
 
 
-def print_frames(frames: Queue, dumped_frames: Value, dumping_interval: Value,
-                 child_error: Queue):
+def print_frames(frame_buffer: shared_memory.SharedMemory, buffer_slots: int, buffered_frames: Semaphore,
+                 free_frame_slots: Semaphore, dumped_frames: Value, dumping_interval: Value, child_error: Connection,
+                 renderer: Process):
     global no_audio_required
     running_child_processes = []
     if not no_audio_required:
         print("Extracting audio from video file...")
-        ffmpeg_options = ["ffmpeg", "-nostdin"] + (["-reconnect", "1", "-reconnect_streamed", "1",
-                                                    "-reconnect_delay_max", "5"] if url else []) + \
-                         ["-i", args.filename, "-loglevel", "error", "-f", "wav", "pipe:1"]
-        audio = subprocess.Popen(ffmpeg_options, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        ffmpeg_options = ["ffmpeg", "-nostdin", *ffmpeg_input_options(video_source), "-loglevel", "error", "-f", "wav",
+                          "pipe:1"]
+        audio_error_log = tempfile.TemporaryFile()
+        audio = subprocess.Popen(ffmpeg_options, stdout=subprocess.PIPE, stderr=audio_error_log)
+        enlarge_pipe(audio.stdout)
         running_child_processes.append(audio)
-        audio_errors = check_for_errors(audio)
+        audio_errors = check_for_errors(audio, audio_error_log)
         if audio_errors:
             print("\x1b[1;33mWarning\x1b[0m: Extracting audio failed:")
             print(audio_errors.decode("utf-8"))
@@ -502,14 +596,28 @@ def print_frames(frames: Queue, dumped_frames: Value, dumping_interval: Value,
         audio = None
     wait_for = video_duration
     interval = 1 / frame_rate
+    frame_columns, frame_lines = video_size[0] - 1, video_size[1] - 1
+    frame_slots = np.ndarray((buffer_slots, frame_lines, frame_columns), dtype=np.uint8, buffer=frame_buffer.buf)
+    # the last frame that was drawn, so that only the rows that changed since then need to go through curses
+    drawn_frame = np.zeros((frame_lines, frame_columns), dtype=np.uint8)
+    drawn_terminal_size = None
 
     while True:
-        average_fps = round(1 / dumping_interval.value, 1)
         time_left = dumping_interval.value * (total_frames-dumped_frames.value)
-        if not time_left > wait_for:
+        if not time_left > wait_for or dumped_frames.value >= buffer_slots:
             break
-        if child_error.qsize() > 0:
-            return child_error.get()
+        # waiting on the error pipe sleeps between progress updates instead of spinning, and still wakes up straight
+        # away if the renderer fails
+        if child_error.poll(PROGRESS_UPDATE_INTERVAL):
+            return child_error.recv()
+        # the renderer can also stop without an error, when ffmpeg fails to start or the video has fewer frames than
+        # its metadata says. no more frames are coming then, so playback would never be ready to start
+        if not renderer.is_alive() and not child_error.poll():
+            if audio:
+                audio.terminate()
+            print(f"\n\x1b[1;31mFatal\x1b[0m: Rendering stopped after {dumped_frames.value} of {total_frames} frames")
+            exit(1)
+        average_fps = round(1 / dumping_interval.value, 1)
         print(f"\rRendering Frame: {dumped_frames.value}/{total_frames} "
               f"Rate: {average_fps}/s Playback ETA:"
               f" {str(datetime.timedelta(seconds=(time_left-video_duration))).split('.')[0]}", end="")
@@ -519,90 +627,92 @@ def print_frames(frames: Queue, dumped_frames: Value, dumping_interval: Value,
     curses.cbreak()
     audio_cmd = None
     if not no_audio_required:
-        blank_sound = subprocess.Popen(["aplay", "--quiet"] if shutil.which("aplay") else ["play", "-q", "-V1", "-t",
-                                                                                           "wav", "-"],
-                                       stdin=subprocess.PIPE)
+        blank_sound = subprocess.Popen(audio_player_command(), stdin=subprocess.PIPE, bufsize=0)
         running_child_processes.append(blank_sound)
-        blank_sound.communicate(input=b'RIFF%\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01\x00\x01\x00D\xac\x00\x00\x88X'
-                                      b'\x01\x00\x02\x00\x10\x00datat\x00\x00\x00\x00')
-        audio_cmd = subprocess.Popen(["aplay", "--quiet"] if shutil.which("aplay") else ["play", "-q", "-V1", "-t",
-                                                                                         "wav", "-"],
-                                     stdin=audio.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        blank_sound.communicate(input=BLANK_WAV)
+        audio_cmd_error_log = tempfile.TemporaryFile()
+        audio_cmd = subprocess.Popen(audio_player_command(), stdin=audio.stdout, stdout=subprocess.PIPE,
+                                     stderr=audio_cmd_error_log)
+        # the audio is piped straight from ffmpeg to the player, so the parent has no use for its end of the pipe
+        audio.stdout.close()
         running_child_processes.append(audio_cmd)
-        audio_cmd_errors = check_for_errors(audio_cmd)
+        audio_cmd_errors = check_for_errors(audio_cmd, audio_cmd_error_log)
         if audio_cmd_errors:
             print("\x1b[1;31mFatal\x1b[0m: Failed to read audio:")
             print(audio_cmd_errors.decode("utf-8"))
-    current_interval = interval
-    displayed_since = datetime.datetime.now()
-    global lag
+    pin_to_cpu(1)
+    displayed_since = time.perf_counter()
     race_condition_error = False
 
     try:
         for current_frame in range(total_frames):
-            if child_error.qsize() > 0:
+            if child_error.poll():
                 os.kill(os.getpid(), signal.SIGINT)
-            start_time = datetime.datetime.now()
-            terminal_lines = shutil.get_terminal_size().lines
-            terminal_columns = shutil.get_terminal_size().columns
-            if frames.qsize() < 1:
+            terminal_lines = terminal_size.lines
+            terminal_columns = terminal_size.columns
+            # playback can start before the renderer is far enough ahead, so a renderer that falls behind is waited
+            # for instead of given up on. the frames whose display time passed in the meantime are dropped below
+            renderer_running = True
+            while not buffered_frames.acquire(timeout=interval):
+                if not renderer_running or child_error.poll():
+                    race_condition_error = True
+                    break
+                renderer_running = renderer.is_alive()
+            if race_condition_error:
                 if not no_audio_required:
                     audio_cmd.kill()
-                race_condition_error = True
                 break
-                # std_scr.clear()
-                # std_scr.addstr(0, 0, "Buffering...")
-                # std_scr.refresh()
-                # time.sleep(10)
-                # std_scr.clear()
-                # if not no_audio_required:
-                #     audio_cmd.send_signal(18)
-                # displayed_since + datetime.timedelta(seconds=10)
-            frame_number, frame_list = frames.get(timeout=interval)
-            time_elapsed = datetime.datetime.now() - displayed_since
-            calculated_frames = round(frame_rate * time_elapsed.total_seconds())
+            # frames whose display time has already passed are dropped so a slow terminal catches back up with the
+            # audio, the last frame is always drawn
+            if current_frame + 1 < total_frames and \
+                    time.perf_counter() - displayed_since >= (current_frame + 1) * interval:
+                free_frame_slots.release()
+                continue
+            frame_number = current_frame
+            frame = frame_slots[current_frame % buffer_slots]
+            if drawn_terminal_size == (terminal_lines, terminal_columns):
+                changed_lines = np.flatnonzero((frame != drawn_frame).any(axis=1))
+            else:
+                # everything is redrawn after a resize or a failed draw
+                changed_lines = range(frame_lines)
+            np.copyto(drawn_frame, frame)
+            free_frame_slots.release()
+            time_elapsed = time.perf_counter() - displayed_since
+            calculated_frames = round(frame_rate * time_elapsed)
             frames_behind = calculated_frames - frame_number
-            pre_duration = (datetime.datetime.now() - start_time).total_seconds()
-            if pre_duration >= current_interval:
-                lag += 1
-                current_interval = (pre_duration - current_interval) / lag
-            std_scr.refresh()
-            h_line_idx = 0
 
+            drawn_terminal_size = None
             try:
-                for frame in frame_list:
-                    if frame[0] < terminal_lines - 1:
-                        std_scr.addstr(frame[0], 0, frame[1])
-                    h_line_idx += 1
+                for line in changed_lines:
+                    if line >= terminal_lines - 1:
+                        break
+                    std_scr.addnstr(line, 0, str(drawn_frame[line].data, "ascii"), terminal_columns - 1)
+                drawn_terminal_size = (terminal_lines, terminal_columns)
                 if args.debug_mode:
                     debug_text = (f"[Frame (required,drawn,lag): ({calculated_frames},{frame_number},{frames_behind}), "
-                                  f"{str(time_elapsed).split('.')[0]}]")
+                                  f"{str(datetime.timedelta(seconds=time_elapsed)).split('.')[0]}]")
                     end_text = f"[{str(datetime.timedelta(seconds=video_duration)).split('.')[0]}, " \
                                f"{total_frames} frames, " \
                                f"{round(calculated_frames/total_frames*100, 1)}%] "
                     if len(debug_text) < terminal_columns - 1:
                         debug_text = debug_text + " "*(terminal_columns-(len(debug_text)+len(end_text))) + end_text
                     progress = round(calculated_frames/total_frames*terminal_columns)
-                    for idx, char in enumerate(debug_text):
-                        if idx < terminal_columns - 1:
-                            f_format = curses.A_STANDOUT if idx < progress else curses.A_NORMAL
-                            try:
-                                std_scr.addch(terminal_lines - 1, idx, char, f_format)
-                            except _curses.error:
-                                pass
+                    try:
+                        std_scr.addnstr(terminal_lines - 1, 0, debug_text, terminal_columns - 1)
+                        std_scr.chgat(terminal_lines - 1, 0, min(progress, terminal_columns - 1), curses.A_STANDOUT)
+                    except _curses.error:
+                        pass
+                # the whole frame is drawn before anything is sent to the terminal
+                std_scr.refresh()
             except _curses.error:
-                continue
-            duration = (datetime.datetime.now() - start_time).total_seconds()
-            if duration < current_interval:
-                if frames_behind < 1:
-                    time.sleep(current_interval - duration)
-                if frames_behind < 0:
-                    time.sleep(current_interval - duration)
-            else:
-                lag += 1
-                current_interval = (duration - current_interval) / lag
-            if current_interval < interval:
-                current_interval = interval
+                # the frame is redrawn in full next time, but it still waits out its own interval so the next frame
+                # isn't shown early
+                pass
+            # frames are paced against fixed deadlines from the start of playback, so an overrun on one frame is caught
+            # up on the next ones instead of delaying every frame after it
+            time_until_next_frame = displayed_since + (current_frame + 1) * interval - time.perf_counter()
+            if time_until_next_frame > 0:
+                time.sleep(time_until_next_frame)
         std_scr.addstr(0, 0, "Press Ctrl-C to exit")
     finally:
         for child in running_child_processes:
@@ -610,12 +720,143 @@ def print_frames(frames: Queue, dumped_frames: Value, dumping_interval: Value,
         curses.echo()
         curses.nocbreak()
         curses.endwin()
-        if child_error.qsize() > 0:
-            return child_error.get()
+        if child_error.poll():
+            return child_error.recv()
         if race_condition_error:
             exit(2)
 
 
+def download_video(video_url: str) -> str:
+    # ffprobe, the frame renderer and the audio extraction all read the video, so a plain video file is only fetched
+    # once into a temporary file they can all share. the file is copied as is, remuxing it could change the frame
+    # timestamps. streams without a known length and playlists are returned as is for ffmpeg to read itself
+    try:
+        response = urllib.request.urlopen(video_url, timeout=DOWNLOAD_TIMEOUT)
+    except (OSError, http.client.HTTPException) as download_error:
+        print(f"\x1b[1;31mFatal\x1b[0m: Failed to download video: {download_error}")
+        exit(1)
+    if response.length is None or response.headers.get_content_type() in PLAYLIST_CONTENT_TYPES or \
+            urllib.parse.urlsplit(video_url).path.lower().endswith(PLAYLIST_EXTENSIONS):
+        response.close()
+        return video_url
+    download_size = response.length
+    try:
+        DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        download_dir = DOWNLOAD_DIR
+    except OSError:
+        download_dir = None
+    with tempfile.NamedTemporaryFile(prefix=f"{PROGRAM_NAME}-", dir=download_dir, delete=False) as downloaded_file:
+        atexit.register(os.unlink, downloaded_file.name)
+        free_space = shutil.disk_usage(downloaded_file.name).free
+        if download_size > free_space:
+            response.close()
+            print(
+                f"\x1b[1;31mFatal\x1b[0m: Not enough space to download video to "
+                f"{os.path.dirname(downloaded_file.name)}: {download_size} bytes needed, {free_space} bytes free"
+            )
+            exit(1)
+        downloaded_size = 0
+        retries_left = DOWNLOAD_RETRIES
+        last_progress_update = 0.0
+        while True:
+            try:
+                if response is None:
+                    # a dropped download carries on from where it stopped if the server supports ranges
+                    response = urllib.request.urlopen(
+                        urllib.request.Request(video_url, headers={"Range": f"bytes={downloaded_size}-"}),
+                        timeout=DOWNLOAD_TIMEOUT
+                    )
+                    if response.status != 206:
+                        downloaded_file.seek(0)
+                        downloaded_file.truncate()
+                        downloaded_size = 0
+                with response:
+                    while video_chunk := response.read(DUMP_WRITE_BUFFER_SIZE):
+                        downloaded_file.write(video_chunk)
+                        downloaded_size += len(video_chunk)
+                        if time.perf_counter() - last_progress_update >= PROGRESS_UPDATE_INTERVAL:
+                            last_progress_update = time.perf_counter()
+                            print_download_progress(downloaded_size, download_size)
+                # a connection that closes early just ends the response without an error
+                if downloaded_size < download_size:
+                    raise ConnectionError(f"connection closed after {downloaded_size} of {download_size} bytes")
+                break
+            except (OSError, http.client.HTTPException) as download_error:
+                response = None
+                # error statuses from the server won't change by asking again
+                if isinstance(download_error, urllib.error.HTTPError) or not retries_left:
+                    print(f"\n\x1b[1;31mFatal\x1b[0m: Failed to download video: {download_error}")
+                    exit(1)
+                retries_left -= 1
+                print(f"\n\x1b[1;33mWarning\x1b[0m: Download interrupted: {download_error}. Retrying...")
+        print_download_progress(downloaded_size, download_size)
+        print()
+    return downloaded_file.name
+
+
+def print_download_progress(downloaded_size: int, download_size: int):
+    print_progress_bar(
+        f"Downloading video: {downloaded_size / 1024 ** 2:.1f}/{download_size / 1024 ** 2:.1f} MiB",
+        downloaded_size / download_size
+    )
+
+
+def is_usable_metadata(metadata) -> bool:
+    return isinstance(metadata, dict) and bool(metadata.get("nb_frames") or metadata.get("nb_read_packets")) and \
+        isinstance(metadata.get("r_frame_rate"), str)
+
+
+def get_video_metadata(filename: str) -> dict:
+    cache_file = None
+    if not url:
+        # probing can take a while, so the results are cached for as long as the file stays the same
+        file_stat = os.stat(filename)
+        cache_key = hashlib.blake2b(
+            f"{os.path.abspath(filename)}|{file_stat.st_mtime_ns}|{file_stat.st_size}".encode("utf-8"), digest_size=16
+        ).hexdigest()
+        cache_file = METADATA_CACHE_DIR / f"{cache_key}.json"
+        try:
+            with open(cache_file) as cached_metadata:
+                file_metadata = json.load(cached_metadata)
+            # a damaged or outdated cache entry is probed again like any other cache miss
+            if is_usable_metadata(file_metadata):
+                return file_metadata
+        except (OSError, json.JSONDecodeError):
+            pass
+    for extra_options in ([], ["-count_packets"]):
+        ffprobe = subprocess.run(
+            [
+                "ffprobe",
+                "-hide_banner",
+                *extra_options,
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "stream=nb_frames,nb_read_packets,r_frame_rate",
+                "-of",
+                "json",
+                filename
+            ],
+            capture_output=True
+        )
+        if ffprobe.returncode:
+            print("\x1b[1;31mFatal\x1b[0m: Failed to extract video metadata:")
+            print(ffprobe.stderr.decode("utf-8"))
+            exit(1)
+        file_metadata = json.loads(ffprobe.stdout).get('streams')[0]
+        # counting packets means reading the whole file, so it is only done when the frame count isn't stored
+        if not isinstance(file_metadata, dict) or file_metadata.get("nb_frames"):
+            break
+    if cache_file and is_usable_metadata(file_metadata):
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_file, "w") as cached_metadata:
+                json.dump(file_metadata, cached_metadata)
+        except OSError:
+            pass
+    return file_metadata
+
+
 if __name__ == '__main__':
     print(f"{PROGRAM_NAME} {__version__}")
     print(__copyright__)
@@ -674,33 +915,45 @@ if __name__ == '__main__':
     )
     args = parser.parse_args()
     if args.tty:
-        try:
-            open(args.tty, "rb").close()
-            open(args.tty, "wb").close()
-        except FileNotFoundError:
+        if not os.path.exists(args.tty):
             print(f"Output pipe \"{args.tty}\" not found!")
             exit(1)
-        except PermissionError:
-            print(f"Need permission to write to \"{args.tty}\"\nRunning sudo...")
-            chown_failed = os.system(f"sudo chown {os.getuid()} {args.tty}") >> 8
-            if chown_failed:
-                print(
-                    f"\x1b[1;31mFatal\x1b[0m: Changing ownership of output pipe failed with exit code {chown_failed}!"
-                )
+        if not os.access(args.tty, os.R_OK | os.W_OK):
+            try:
+                os.chown(args.tty, os.getuid(), -1)
+            except PermissionError:
+                print(f"Need permission to write to \"{args.tty}\"\nRunning sudo...")
+                try:
+                    chown_failed = subprocess.run(["sudo", "chown", str(os.getuid()), args.tty]).returncode
+                except FileNotFoundError:
+                    print("\x1b[1;31mFatal\x1b[0m: Changing ownership of output pipe failed: sudo not found")
+                    exit(1)
+                if chown_failed:
+                    print(
+                        f"\x1b[1;31mFatal\x1b[0m: Changing ownership of output pipe failed with exit code "
+                        f"{chown_failed}!"
+                    )
+                    exit(1)
+            except OSError as chown_error:
+                print(f"\x1b[1;31mFatal\x1b[0m: Changing ownership of output pipe failed: {chown_error}")
                 exit(1)
-            chmod_failed = os.system(f"chmod 600 {args.tty}") >> 8
-            if chmod_failed:
-                print(
-                    f"\x1b[1;31mFatal\x1b[0m: Changing permissions of output pipe failed with exit code {chmod_failed}!"
-                )
+            try:
+                os.chmod(args.tty, 0o600)
+            except OSError as chmod_error:
+                print(f"\x1b[1;31mFatal\x1b[0m: Changing permissions of output pipe failed: {chmod_error}")
                 exit(1)
 
         print("Running on another terminal session...")
-        with open(args.tty, 'rb') as inf, open(args.tty, 'wb') as outf:
-            os.dup2(inf.fileno(), 0)
-            os.dup2(outf.fileno(), 1)
-            os.dup2(outf.fileno(), 2)
+        # one read/write descriptor backs all three standard streams. O_TRUNC is ignored for terminals and still
+        # clears a regular output file like opening it for writing did
+        tty_fd = os.open(args.tty, os.O_RDWR | os.O_TRUNC)
+        for std_fd in (0, 1, 2):
+            os.dup2(tty_fd, std_fd)
+        os.close(tty_fd)
         os.environ['TERM'] = 'linux'
+    update_terminal_size()
+    if hasattr(signal, "SIGWINCH"):
+        signal.signal(signal.SIGWINCH, update_terminal_size)
     if args.no_audio:
         no_audio_required = True
         if len(sys.argv) > 2:
@@ -708,7 +961,7 @@ if __name__ == '__main__':
         else:
             print("No video file specified. Please specify one. mp4 files works the best")
             exit(1)
-    elif not (shutil.which("aplay") or shutil.which("play")):
+    elif not audio_player_command():
         print(f"\x1b[1;31mFatal\x1b[0m: aplay or play executable not found. "
               f"Please make sure alsa-utils or sox is installed and make "
               f"sure the executable is in your PATH.")
@@ -728,85 +981,79 @@ if __name__ == '__main__':
     if not (url or stdin) and not os.path.exists(args.filename):
         print(f"File \"{args.filename}\" not found!")
         exit(1)
-    if not (url or stdin):
+    is_vidtxt = args.filename.endswith(".vidtxt")
+    if not (is_vidtxt or url or stdin):
+        # the extension is enough to tell, so the signature is only checked for other files
         with open(args.filename, "rb") as vidtxt_check:
-            first_8 = vidtxt_check.read(8)
-    if (not (url or stdin)) and (args.filename.endswith(".vidtxt") or first_8 == b'VIDTXT\x00\x00'):
+            is_vidtxt = vidtxt_check.read(8) == b'VIDTXT\x00\x00'
+    if (not (url or stdin)) and is_vidtxt:
         if args.info:
             vidtxt_info(args.filename)
         else:
             file_print_frames(args.filename)
     else:
-        ffprobe = subprocess.Popen(
-            [
-                "ffprobe",
-                "-hide_banner",
-                "-count_packets",
-                "-show_streams",
-                "-of",
-                "json",
-                args.filename
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        ffprobe.wait()
-        if ffprobe.returncode:
-            print("\x1b[1;31mFatal\x1b[0m: Failed to extract video metadata:")
-            print(ffprobe.stderr.read().decode("utf-8"))
-            exit(1)
+        video_source = download_video(args.filename) if url else args.filename
         try:
-            file_metadata = json.load(ffprobe.stdout).get('streams')[0]
+            file_metadata = get_video_metadata(video_source)
             total_frames = int(file_metadata.get("nb_frames") or file_metadata.get("nb_read_packets"))
-            fps_fraction = file_metadata.get("r_frame_rate").split("/")
-            frame_rate = float(int(fps_fraction[0])/int(fps_fraction[1]))
-        except (ValueError, TypeError, IndexError, json.JSONDecodeError) as err:
+            fps_numerator, fps_denominator = map(int, file_metadata.get("r_frame_rate").split("/"))
+            # ffprobe reports 0/0 for streams without a frame rate
+            exact_frame_rate = Fraction(fps_numerator, fps_denominator) if fps_denominator else Fraction(0)
+        except (ValueError, TypeError, IndexError, AttributeError, json.JSONDecodeError) as err:
             err: BaseException
             print("\x1b[1;31mFatal\x1b[0m: Failed to extract video metadata:\nUnexpected or missing metadata. "
                   "Is this file a video?")
             if args.debug_mode:
                 print(str(err))
             exit(1)
-        frame_rate = 30.0 if not frame_rate else frame_rate
-        video_duration = (total_frames // frame_rate) + (total_frames % frame_rate) / frame_rate
-        global_interval = (1 / frame_rate)
+        exact_frame_rate = exact_frame_rate or Fraction(30)
+        frame_rate = float(exact_frame_rate)
+        video_duration = float(total_frames / exact_frame_rate)
         video_size: list[int] = (
-            (lambda px: [args.columns or px.columns, args.lines or px.lines])(shutil.get_terminal_size())
+            (lambda px: [args.columns or px.columns, args.lines or px.lines])(terminal_size)
         )
         if args.video_size:
-            arg_video_size_parts = args.video_size.split('x')
-            if len(arg_video_size_parts) != 2 or ():
-                print("\x1b[1;31mFatal\x1b[0m: Bad video-size argument. must be 'columns x lines'")
+            video_size_match = VIDEO_SIZE_PATTERN.fullmatch(args.video_size.strip())
+            if not video_size_match:
+                print("\x1b[1;31mFatal\x1b[0m: Bad video-size argument. must be 'columns x lines' in decimal numbers")
                 exit(1)
-            if not all([part.isdecimal() for part in arg_video_size_parts]):
-                print("\x1b[1;31mFatal\x1b[0m: Bad video-size argument. must be decimal numbers")
-                exit(1)
-            video_size = [int(part.strip()) for part in arg_video_size_parts]
+            video_size = [int(video_size_match.group(1)), int(video_size_match.group(2))]
+        # the first column and last line of every frame are cropped out, so anything smaller leaves nothing to show
+        if video_size[0] < 2 or video_size[1] < 2:
+            print("\x1b[1;31mFatal\x1b[0m: Bad video size. The video must be at least 2 columns by 2 lines")
+            exit(1)
         if args.dump:
-            dump_frames(args.filename, frame_rate, video_size)
+            dump_frames(video_source, frame_rate, video_size)
         else:
-            manager = Manager()
-            queue = manager.Queue()
+            frame_bytes = (video_size[0] - 1) * (video_size[1] - 1)
+            frame_buffer_slots = max(1, min(total_frames, FRAME_BUFFER_SIZE // frame_bytes))
+            shared_frame_buffer = shared_memory.SharedMemory(create=True, size=frame_buffer_slots * frame_bytes)
+            shared_buffered_frames = Semaphore(0)
+            shared_free_frame_slots = Semaphore(frame_buffer_slots)
             shared_dumped_frames = Value(ctypes.c_int, 0)
             shared_dumping_interval = Value(ctypes.c_float, 1)
-            shared_child_error = manager.Queue()
+            # the renderer only ever sends an error to the printer, so a one way pipe is enough
+            shared_child_error, child_error_sender = Pipe(duplex=False)
             running_global_child_subprocesses = []
-            p1 = Process(target=render_frames, args=(queue, shared_dumped_frames, shared_dumping_interval,
-                                                     shared_child_error, args.filename, total_frames, video_size),
+            shared_frame_args = (shared_frame_buffer, frame_buffer_slots, shared_buffered_frames,
+                                 shared_free_frame_slots, shared_dumped_frames, shared_dumping_interval)
+            p1 = Process(target=render_frames, args=(*shared_frame_args, child_error_sender, video_source,
+                                                     total_frames, video_size),
                          name="Frame Renderer")
             running_global_child_subprocesses.append(p1)
             try:
-                p2 = Process(target=print_frames, args=(queue, shared_dumped_frames, shared_dumping_interval,
-                                                        shared_child_error,))
-                running_global_child_subprocesses.append(p2)
-                p1.exception = exception_handler
                 p1.start()
-                child_error_state = print_frames(queue, shared_dumped_frames, shared_dumping_interval,
-                                                 shared_child_error)
+                child_error_state = print_frames(*shared_frame_args, shared_child_error, p1)
                 if child_error_state:
                     exception_handler(*child_error_state)
             finally:
                 for global_child in running_global_child_subprocesses:
                     if global_child.is_alive():
                         global_child.terminate()
-                p1.terminate()
+                        global_child.join(0.5)
+                    # a child stuck inside a blocking call can ignore SIGTERM
+                    if global_child.is_alive():
+                        global_child.kill()
+                        global_child.join(0.1)
+                shared_frame_buffer.close()
+                shared_frame_buffer.unlink()